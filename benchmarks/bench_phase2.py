@@ -0,0 +1,56 @@
+"""
+Misura i tempi della correzione (fase 2) su una classe sintetica.
+
+Uso: python benchmarks/bench_phase2.py [studenti] [domande] [varianti]
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.analyzer import analyze_questions
+from core.config import AppConfig
+from core.logic import correct_tests
+from core.models import Question, AnswerChoice, TestVariant, StudentSubmission
+
+class _BenchConfig(AppConfig):
+    """Configurazione predefinita (punteggi 4/0/1) senza leggere config.json."""
+    def _load_config(self, config_file: str) -> dict:
+        return {}
+
+def make_class(num_students: int, num_questions: int, num_variants: int, seed: int = 0):
+    rng = random.Random(seed)
+    # Una domanda su sette ha un punteggio personalizzato (float, come da _parse_row)
+    questions = [Question(f"Domanda {k}", f"Foglio {k}", [AnswerChoice("giusta", True), AnswerChoice("sbagliata")],
+                          punteggio_errata=-1.0 if k % 7 == 0 else None)
+                 for k in range(num_questions)]
+    variants, answer_keys, question_mappings = [], {}, {}
+    for v in range(1, num_variants + 1):
+        order = questions[:]
+        rng.shuffle(order)
+        variants.append(TestVariant(str(v), questions))
+        answer_keys[str(v)] = {str(j + 1): rng.choice("ABCD") for j in range(num_questions)}
+        question_mappings[str(v)] = {str(j + 1): q.sheet_name for j, q in enumerate(order)}
+    submissions = [
+        StudentSubmission(f"S{s:05d}", str(rng.randint(1, num_variants)),
+                          {str(j + 1): rng.choice(["A", "b", "", "nan", "C", "d"]) for j in range(num_questions)})
+        for s in range(num_students)
+    ]
+    return submissions, variants, answer_keys, question_mappings, _BenchConfig()
+
+def best_of(func, repeat: int = 7) -> float:
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def main():
+    num_students, num_questions, num_variants = (list(map(int, sys.argv[1:4])) + [2000, 60, 6][len(sys.argv[1:4]):])
+    args = make_class(num_students, num_questions, num_variants)
+    print(f"{num_students} studenti x {num_questions} domande x {num_variants} varianti")
+    print(f"correct_tests: {best_of(lambda: correct_tests(*args)):.4f} s")
+    test_results, question_stats = correct_tests(*args)
+    # analyze_questions aggiorna le statistiche sul posto: ogni ripetizione parte da una copia
+    print(f"analyze_questions: {best_of(lambda: analyze_questions(test_results, {sheet: dict(stats) for sheet, stats in question_stats.items()})):.4f} s")
+
+if __name__ == "__main__":
+    main()
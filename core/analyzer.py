@@ -1,50 +1,61 @@
 import numpy as np
-import scipy.stats as stats
 from typing import Dict, Any, Tuple
 
-def _calculate_stanine(score: float, boundaries: np.ndarray) -> str:
-    if score < boundaries[0]:
-        return "F-"
-    elif score < boundaries[1]:
-        return "F"
-    elif score < boundaries[2]:
-        return "E"
-    elif score < boundaries[3]:
-        return "D"
-    elif score < boundaries[4]:
-        return "C"
-    elif score < boundaries[5]:
-        return "B"
-    elif score < boundaries[6]:
-        return "A"
-    elif score < boundaries[7]:
-        return "S"
-    else:
-        return "S+"
-
-def calculate_basic_statistics(test_results: Dict[str, Any], passing_threshold: float) -> Tuple[float, float, Dict[str, Any]]:
-    scores = [res["total_score"] for res in test_results.values()]
-    percentages = [res["percentage"] for res in test_results.values()]
+# Etichette stanine: l'indice è il numero di confini (percentili 4, 11, 23, 40, 60, 77, 89, 96) non superiori al punteggio
+_STANINE_LABELS = np.array(["F-", "F", "E", "D", "C", "B", "A", "S", "S+"])
+
+def _percentile_ranks(scores: np.ndarray) -> np.ndarray:
+    """
+    Rango percentile di ogni punteggio rispetto all'intera classe, come
+    scipy.stats.percentileofscore(scores, score, kind='rank') ma con un solo ordinamento.
+    """
+    sorted_scores = np.sort(scores)
+    left = np.searchsorted(sorted_scores, scores, side="left")
+    right = np.searchsorted(sorted_scores, scores, side="right")
+    return (left + right + (left < right)) * (50.0 / len(scores))
+
+# Campi numerici dei risultati per studente, letti una sola volta in _results_columns
+_RESULT_FIELDS = ("total_score", "percentage", "correct_score", "wrong_score", "blank_score",
+                  "correct_count", "wrong_count", "blank_count")
+
+def _results_columns(test_results: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """
+    Un array per campo di _RESULT_FIELDS (uno studente per elemento, nell'ordine di test_results),
+    ottenuti con un'unica passata sul dizionario dei risultati.
+    """
+    data = np.fromiter((res[field] for res in test_results.values() for field in _RESULT_FIELDS),
+                       dtype=np.float64, count=len(test_results) * len(_RESULT_FIELDS))
+    # Trasposta contigua: ogni campo è una riga, così le riduzioni lavorano su memoria consecutiva
+    return dict(zip(_RESULT_FIELDS, np.ascontiguousarray(data.reshape(-1, len(_RESULT_FIELDS)).T)))
+
+def calculate_basic_statistics(test_results: Dict[str, Any], passing_threshold: float,
+                               columns: Dict[str, np.ndarray] = None) -> Tuple[float, float, Dict[str, Any]]:
+    if columns is None:
+        columns = _results_columns(test_results)
+    scores = columns["total_score"]
+    percentages = columns["percentage"]
 
     avg_score = np.mean(scores)
     med_score = np.median(scores)
     std_dev = np.std(scores)
-    min_score = min(scores)
-    max_score = max(scores)
+    # Minimo e massimo restano del tipo originale (int se i punteggi sono interi)
+    results = list(test_results.values())
+    min_score = results[int(np.argmin(scores))]["total_score"]
+    max_score = results[int(np.argmax(scores))]["total_score"]
 
     threshold = passing_threshold * 100
-    passed = sum(1 for p in percentages if p >= threshold)
-    pass_rate = round((passed / len(percentages)) * 100, 2) if percentages else 0
+    passed = np.count_nonzero(percentages >= threshold)
+    pass_rate = round((passed / len(percentages)) * 100, 2) if len(percentages) else 0
 
     quartiles = np.percentile(scores, [25, 50, 75])
 
-    avg_correct = np.mean([res["correct_score"] for res in test_results.values()])
-    avg_wrong = np.mean([res["wrong_score"] for res in test_results.values()])
-    avg_blank = np.mean([res["blank_score"] for res in test_results.values()])
+    avg_correct = np.mean(columns["correct_score"])
+    avg_wrong = np.mean(columns["wrong_score"])
+    avg_blank = np.mean(columns["blank_score"])
 
-    avg_correct_count = np.mean([res["correct_count"] for res in test_results.values()])
-    avg_wrong_count = np.mean([res["wrong_count"] for res in test_results.values()])
-    avg_blank_count = np.mean([res["blank_count"] for res in test_results.values()])
+    avg_correct_count = np.mean(columns["correct_count"])
+    avg_wrong_count = np.mean(columns["wrong_count"])
+    avg_blank_count = np.mean(columns["blank_count"])
 
     analysis_results = {
         "num_students": len(scores),
@@ -69,21 +80,18 @@ def analyze_results(test_results: Dict[str, Any], passing_threshold: float) -> D
     if not test_results:
         return {}
 
-    scores = [res["total_score"] for res in test_results.values()]
-
-    if not scores:
-        return {}
-
-    avg_score, std_dev, analysis_results = calculate_basic_statistics(test_results, passing_threshold)
+    columns = _results_columns(test_results)
+    avg_score, std_dev, analysis_results = calculate_basic_statistics(test_results, passing_threshold, columns)
 
+    scores = columns["total_score"]
     stanine_boundaries = np.percentile(scores, [4, 11, 23, 40, 60, 77, 89, 96])
 
-    for student_id, result in test_results.items():
-        z_score = (result["total_score"] - avg_score) / std_dev if std_dev != 0 else 0
-        percentile = stats.percentileofscore(scores, result["total_score"])
-        stanine = _calculate_stanine(result["total_score"], stanine_boundaries)
+    z_scores = (scores - avg_score) / std_dev if std_dev != 0 else np.zeros(len(scores), dtype=int)
+    percentiles = _percentile_ranks(scores)
+    stanines = _STANINE_LABELS[np.searchsorted(stanine_boundaries, scores, side="right")].tolist()
 
-        test_results[student_id].update({
+    for result, z_score, percentile, stanine in zip(test_results.values(), z_scores, percentiles, stanines):
+        result.update({
             "z_score": round(z_score, 2),
             "percentile": round(percentile, 2),
             "stanine": stanine
@@ -91,65 +99,56 @@ def analyze_results(test_results: Dict[str, Any], passing_threshold: float) -> D
 
     return analysis_results
 
+def _correct_counts_by_sheet(group_results, sheet_to_col: Dict[str, int]) -> np.ndarray:
+    """
+    Numero di studenti del gruppo che hanno risposto correttamente a ciascun foglio, senza
+    distinzione tra maiuscole e minuscole; più risposte allo stesso foglio contano una volta.
+    """
+    correct_cols = []
+    for result in group_results:
+        # str.upper per cella: su stringhe così corte è più veloce di np.char.upper
+        student_cols = {sheet_to_col.get(ans_data["sheet"]) for ans_data in result["answers"].values()
+                        if ans_data["response"] != "blank" and ans_data["response"].upper() == ans_data["correct"].upper()}
+        student_cols.discard(None)
+        correct_cols.extend(student_cols)
+    return np.bincount(np.array(correct_cols, dtype=np.intp), minlength=len(sheet_to_col))
+
 def analyze_questions(test_results: Dict[str, Any], question_analytics: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, Any]]:
     if not question_analytics or not test_results:
         return question_analytics
 
-    student_scores = [(student_id, result) for student_id, result in test_results.items()]
-    student_scores.sort(key=lambda x: x[1]["total_score"], reverse=True)
+    ranked_results = sorted(test_results.values(), key=lambda result: result["total_score"], reverse=True)
 
-    n = len(student_scores)
+    n = len(ranked_results)
     upper_n = max(1, int(n * 0.27))
     lower_n = max(1, int(n * 0.27))
 
-    upper_group = student_scores[:upper_n]
-    lower_group = student_scores[-lower_n:]
-
-    upper_correct_counts = {}
-    for _, result in upper_group:
-        seen_sheets = set()
-        for ans_data in result["answers"].values():
-            sheet_name = ans_data["sheet"]
-            if sheet_name not in seen_sheets and ans_data["response"] != "blank" and \
-               ans_data["response"].upper() == ans_data["correct"].upper():
-                upper_correct_counts[sheet_name] = upper_correct_counts.get(sheet_name, 0) + 1
-                seen_sheets.add(sheet_name)
-
-    lower_correct_counts = {}
-    for _, result in lower_group:
-        seen_sheets = set()
-        for ans_data in result["answers"].values():
-            sheet_name = ans_data["sheet"]
-            if sheet_name not in seen_sheets and ans_data["response"] != "blank" and \
-               ans_data["response"].upper() == ans_data["correct"].upper():
-                lower_correct_counts[sheet_name] = lower_correct_counts.get(sheet_name, 0) + 1
-                seen_sheets.add(sheet_name)
-
-    for sheet_name, stats_dict in question_analytics.items():
-        total_answers = stats_dict["correct"] + stats_dict["wrong"] + stats_dict["blank"]
-        if total_answers == 0:
+    # Solo il 27% superiore e quello inferiore entrano nell'indice di discriminazione
+    sheet_to_col = {sheet_name: col for col, sheet_name in enumerate(question_analytics)}
+    upper_correct_counts = _correct_counts_by_sheet(ranked_results[:upper_n], sheet_to_col)
+    lower_correct_counts = _correct_counts_by_sheet(ranked_results[-lower_n:], sheet_to_col)
+    discriminations = (upper_correct_counts / upper_n - lower_correct_counts / lower_n).tolist()
+
+    # Righe = fogli, colonne = (corrette, errate, non date); le percentuali si calcolano per tutti i fogli insieme
+    counts = np.array([[stats_dict["correct"], stats_dict["wrong"], stats_dict["blank"]]
+                       for stats_dict in question_analytics.values()], dtype=np.int64).reshape(-1, 3)
+    totals = counts.sum(axis=1)
+    fractions = counts / np.maximum(totals, 1)[:, None]
+    percentages = (fractions * 100).tolist()
+    difficulties = (1.0 - fractions[:, 0]).tolist()
+    totals = totals.tolist()
+
+    for col, stats_dict in enumerate(question_analytics.values()):
+        if totals[col] == 0:
             continue
-
-        correct_pct = round((stats_dict["correct"] / total_answers) * 100, 2)
-        wrong_pct = round((stats_dict["wrong"] / total_answers) * 100, 2)
-        blank_pct = round((stats_dict["blank"] / total_answers) * 100, 2)
-
-        difficulty = 1.0 - (stats_dict["correct"] / total_answers)
-
-        upper_correct = upper_correct_counts.get(sheet_name, 0)
-        lower_correct = lower_correct_counts.get(sheet_name, 0)
-
-        p_upper = upper_correct / upper_n if upper_n > 0 else 0
-        p_lower = lower_correct / lower_n if lower_n > 0 else 0
-        discrimination = p_upper - p_lower
-
-        question_analytics[sheet_name].update({
-            "total_answers": total_answers,
-            "correct_pct": correct_pct,
-            "wrong_pct": wrong_pct,
-            "blank_pct": blank_pct,
-            "difficulty": round(difficulty, 2),
-            "discrimination": round(discrimination, 2)
+        correct_pct, wrong_pct, blank_pct = percentages[col]
+        stats_dict.update({
+            "total_answers": totals[col],
+            "correct_pct": round(correct_pct, 2),
+            "wrong_pct": round(wrong_pct, 2),
+            "blank_pct": round(blank_pct, 2),
+            "difficulty": round(difficulties[col], 2),
+            "discrimination": round(discriminations[col], 2)
         })
 
     return question_analytics
@@ -1,6 +1,8 @@
 import json
 import re
 
+_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+
 class AppConfig:
     def __init__(self, config_file: str = "config.json"):
         self.raw_config = self._load_config(config_file)
@@ -14,7 +16,7 @@ class AppConfig:
         try:
             with open(config_file, 'r', encoding='utf-8') as f:
                 content = f.read()
-            content = re.sub(r'/\*.*?\*/', '', content, flags=re.DOTALL)
+            content = _COMMENT_RE.sub('', content)
             return json.loads(content)
         except FileNotFoundError:
             raise FileNotFoundError(f"File di configurazione non trovato: {config_file}")
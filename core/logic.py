@@ -1,4 +1,4 @@
-import copy
+import dataclasses
 import numpy as np
 from typing import List, Dict, Any, Tuple
 from core.models import Question, TestVariant, StudentSubmission
@@ -12,11 +12,20 @@ def generate_test_variants(questions_data: List[Question], num_variants: int, rn
     if not questions_data:
         return []
     variants = []
+    num_questions = len(questions_data)
     for i in range(num_variants):
-        variant_questions = copy.deepcopy(questions_data)
-        rng.shuffle(variant_questions)
-        for question in variant_questions:
-            rng.shuffle(question.answers)
+        # Si permutano solo gli indici: le AnswerChoice sono condivise tra le varianti
+        question_order = list(range(num_questions))
+        rng.shuffle(question_order)
+        variant_questions = []
+        for q_idx in question_order:
+            question = questions_data[q_idx]
+            answer_order = list(range(len(question.answers)))
+            rng.shuffle(answer_order)
+            correct_index = answer_order.index(question.correct_index) if question.answers else 0
+            variant_questions.append(dataclasses.replace(question,
+                                                         answers=[question.answers[a] for a in answer_order],
+                                                         correct_index=correct_index))
         variant = TestVariant(
             variant_id=str(i + 1),
             questions=variant_questions
@@ -31,36 +40,44 @@ def evaluate_randomness_of_variants(variants: List[TestVariant], original_questi
     if not variants or not original_questions_order:
         return {"question_order_randomness": 0, "answer_order_randomness": 0, "combined_randomness": 0}
     num_questions = len(original_questions_order)
-    question_order_scores = []
+    question_ids = {}
+    for q_text in original_questions_order:
+        question_ids.setdefault(q_text, len(question_ids))
+    alternatives_by_id = {}
     for variant in variants:
-        variant_order = [q.question_text for q in variant.questions]
-        diff_count = sum(1 for orig, var in zip(original_questions_order, variant_order) if orig != var)
-        question_order_scores.append(diff_count / num_questions)
-    question_order_randomness = np.mean(question_order_scores)
+        for question in variant.questions:
+            q_id = question_ids.setdefault(question.question_text, len(question_ids))
+            alternatives_by_id.setdefault(q_id, len(question.answers))
+    original_ids = np.array([question_ids[q_text] for q_text in original_questions_order])
+
+    # Q[v, i] = id della domanda in posizione i della variante v (-1 se la variante è più corta)
+    order_matrix = np.full((len(variants), num_questions), -1)
+    for v, variant in enumerate(variants):
+        row = [question_ids[q.question_text] for q in variant.questions[:num_questions]]
+        order_matrix[v, :len(row)] = row
+    diff_counts = np.count_nonzero((order_matrix != original_ids) & (order_matrix >= 0), axis=1)
+    question_order_randomness = np.mean(diff_counts / num_questions)
 
-    answer_positions = {}
-    q_alternatives = {}
+    # Posizione della risposta corretta per ogni occorrenza di ogni domanda
+    labels, positions = [], []
     for variant in variants:
         for question in variant.questions:
-            q_text = question.question_text
-            correct_index = next((i for i, ans in enumerate(question.answers) if ans.is_correct), 0)
-            if q_text not in answer_positions:
-                answer_positions[q_text] = []
-                q_alternatives[q_text] = len(question.answers)
-            answer_positions[q_text].append(correct_index)
-
-    normalized_stds = []
-    for q_text, positions in answer_positions.items():
-        arr = np.array(positions)
-        if len(arr) > 1 and (max(arr) - min(arr)) > 0:
-            std = np.std(arr)
-            n_alternatives = q_alternatives.get(q_text, 1)
-            norm_std = std / (n_alternatives - 1) if n_alternatives > 1 else 0
-            normalized_stds.append(norm_std)
-        else:
-            normalized_stds.append(0)
+            labels.append(question_ids[question.question_text])
+            positions.append(question.correct_index)
 
-    answer_order_randomness = np.mean(normalized_stds) if normalized_stds else 0
+    if labels:
+        labels = np.array(labels)
+        positions = np.array(positions, dtype=np.float64)
+        present_ids = np.unique(labels)
+        counts = np.maximum(np.bincount(labels), 1)
+        means = np.bincount(labels, weights=positions) / counts
+        stds = np.sqrt(np.bincount(labels, weights=(positions - means[labels]) ** 2) / counts)[present_ids]
+        group_alternatives = np.array([alternatives_by_id[q_id] for q_id in present_ids.tolist()])
+        normalized_stds = np.where((stds > 0) & (group_alternatives > 1),
+                                   stds / np.maximum(group_alternatives - 1, 1), 0)
+        answer_order_randomness = np.mean(normalized_stds)
+    else:
+        answer_order_randomness = 0
     combined_randomness = (question_order_randomness + answer_order_randomness) / 2
 
     return {
@@ -73,90 +90,157 @@ def select_best_variants(potential_variants: List[TestVariant], original_questio
     """
     Seleziona le migliori varianti in base a uno score.
     """
+    # Confronto su id interi: un testo diverso da tutti quelli originali riceve -1
+    question_ids = {}
+    original_ids = np.array([question_ids.setdefault(q_text, len(question_ids)) for q_text in original_questions_order],
+                            dtype=np.int64)
     scores = []
     for variant in potential_variants:
-        variant_order = [q.question_text for q in variant.questions]
-        diff_count = sum(1 for orig, var in zip(original_questions_order, variant_order) if orig != var)
+        variant_ids = np.array([question_ids.get(q.question_text, -1) for q in variant.questions[:len(original_ids)]],
+                               dtype=np.int64)
+        diff_count = np.count_nonzero(variant_ids != original_ids[:len(variant_ids)])
         question_order_score = diff_count / len(original_questions_order) if original_questions_order else 0
         answer_scores = []
         for question in variant.questions:
             n_alternatives = len(question.answers)
-            correct_index = next((i for i, ans in enumerate(question.answers) if ans.is_correct), 0)
-            score = (correct_index / (n_alternatives - 1)) if n_alternatives > 1 else 0
+            score = (question.correct_index / (n_alternatives - 1)) if n_alternatives > 1 else 0
             answer_scores.append(score)
         answer_order_score = np.mean(answer_scores) if answer_scores else 0
-        variant_score = (question_order_score + answer_order_score) / 2
-        scores.append((variant_score, variant))
-    scores.sort(key=lambda x: x[0], reverse=True)
-    return [v for score, v in scores[:num_variants]]
-
-def score_single_student(submission: StudentSubmission,
-                         key_mapping: Dict[str, str],
-                         question_mapping: Dict[str, str],
-                         question_data_map: Dict[str, Question],
-                         config: AppConfig,
-                         question_stats: Dict[str, Dict[str, int]]) -> Dict[str, Any]:
+        scores.append((question_order_score + answer_order_score) / 2)
+    scores = np.array(scores, dtype=np.float64)
+    k = len(scores[:num_variants])
+    if k == 0:
+        return []
+    # Selezione dei primi k in O(n): soglia con np.partition, poi ordinamento stabile dei soli candidati
+    # (a parità di score vince la variante generata prima, come con il sort completo)
+    threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+    candidates = np.flatnonzero(scores >= threshold)
+    best = candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+    return [potential_variants[i] for i in best.tolist()]
+
+def _score_table(columns: List[str],
+                 question_mapping: Dict[str, str],
+                 question_data_map: Dict[str, Question],
+                 config: AppConfig) -> Tuple[List[Any], List[Any], List[Any]]:
     """
-    Calcola i punteggi per un singolo studente e aggiorna le statistiche delle domande in question_stats.
+    Restituisce, per ciascuna colonna, i punti per risposta corretta, errata e non data
+    (personalizzati dalla domanda o di default), come tre liste allineate alle colonne.
+    I valori restano quelli originali (int o float), come nel calcolo per singolo studente.
     """
-    correct_count = 0
-    wrong_count = 0
-    blank_count = 0
-    correct_score = 0
-    wrong_score = 0
-    blank_score = 0
-    max_possible_score = 0
-    student_answers = {}
-
-    for col, student_ans in submission.answers.items():
-        if col in key_mapping and col in question_mapping:
-            correct_letter = key_mapping[col]
-            sheet_name = question_mapping[col]
-            question_data = question_data_map.get(sheet_name)
-
-            if question_data:
-                punto_corretta = question_data.punteggio_corretta if question_data.punteggio_corretta is not None else config.default_correct_score
-                punto_errata = question_data.punteggio_errata if question_data.punteggio_errata is not None else config.default_wrong_score
-                punto_non_data = question_data.punteggio_non_data if question_data.punteggio_non_data is not None else config.default_no_answer_score
-            else:
-                punto_corretta = config.default_correct_score
-                punto_errata = config.default_wrong_score
-                punto_non_data = config.default_no_answer_score
+    punti_corretta, punti_errata, punti_non_data = [], [], []
+    for col in columns:
+        question_data = question_data_map.get(question_mapping[col])
+        if question_data:
+            punti_corretta.append(question_data.punteggio_corretta if question_data.punteggio_corretta is not None else config.default_correct_score)
+            punti_errata.append(question_data.punteggio_errata if question_data.punteggio_errata is not None else config.default_wrong_score)
+            punti_non_data.append(question_data.punteggio_non_data if question_data.punteggio_non_data is not None else config.default_no_answer_score)
+        else:
+            punti_corretta.append(config.default_correct_score)
+            punti_errata.append(config.default_wrong_score)
+            punti_non_data.append(config.default_no_answer_score)
+    return punti_corretta, punti_errata, punti_non_data
+
+def _answer_columns(submissions: List[StudentSubmission],
+                    key_mapping: Dict[str, str],
+                    question_mapping: Dict[str, str]) -> List[str]:
+    """Colonne di risposta presenti nelle consegne che corrispondono a una domanda della variante."""
+    # Di norma tutte le consegne hanno le stesse colonne: si scorrono solo le sequenze distinte
+    column_orders = dict.fromkeys(tuple(s.answers) for s in submissions)
+    return [col for col in dict.fromkeys(col for order in column_orders for col in order)
+            if col in key_mapping and col in question_mapping]
+
+# Esiti di una cella della matrice studenti x domande
+_CORRECT, _WRONG, _BLANK, _ABSENT = 0, 1, 2, 3
 
-            max_possible_score += punto_corretta
+def score_variant_group(submissions: List[StudentSubmission],
+                        columns: List[str],
+                        key_mapping: Dict[str, str],
+                        question_mapping: Dict[str, str],
+                        question_data_map: Dict[str, Question],
+                        config: AppConfig) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    Calcola i punteggi di tutti gli studenti di una stessa variante. Un solo passaggio sulle
+    risposte le classifica e compone il dettaglio per risposta; conteggi e totali si calcolano
+    sulla matrice degli esiti (studenti x domande). Restituisce i risultati per studente e una
+    matrice (colonne x 3) con il numero di risposte corrette, errate e non date per colonna.
+    """
+    num_columns = len(columns)
+    column_index = {col: j for j, col in enumerate(columns)}
+    sheets = [question_mapping[col] for col in columns]
+    keys = [key_mapping[col] for col in columns]
+    upper_keys = [key.upper() for key in keys]
+    punti_corretta, punti_errata, punti_non_data = _score_table(columns, question_mapping, question_data_map, config)
 
+    outcome_rows = []
+    answers_by_student = []
+    totals_by_student = []
+    # Posizioni in columns di ogni sequenza distinta di colonne (None se la colonna è da ignorare)
+    layouts = {}
+    for submission in submissions:
+        answers = submission.answers
+        order = tuple(answers)
+        positions = layouts.get(order)
+        if positions is None:
+            positions = layouts[order] = [column_index.get(col) for col in order]
+        row = [_ABSENT] * num_columns
+        student_answers = {}
+        # Punteggi sommati sui valori originali nell'ordine delle risposte, come nel calcolo per singolo studente
+        correct_score = 0
+        wrong_score = 0
+        blank_score = 0
+        max_possible_score = 0
+        for col, j, student_ans in zip(order, positions, answers.values()):
+            if j is None:
+                continue
+            max_possible_score += punti_corretta[j]
             if not student_ans or student_ans == "nan":  # Risposta non data
-                blank_count += 1
-                blank_score += punto_non_data
-                student_answers[col] = {"sheet": sheet_name, "response": "blank", "correct": correct_letter, "points": punto_non_data}
-                question_stats[sheet_name]["blank"] += 1
-            elif student_ans.upper() == correct_letter.upper():
-                correct_count += 1
-                correct_score += punto_corretta
-                student_answers[col] = {"sheet": sheet_name, "response": student_ans, "correct": correct_letter, "points": punto_corretta}
-                question_stats[sheet_name]["correct"] += 1
+                row[j] = _BLANK
+                blank_score += punti_non_data[j]
+                student_answers[col] = {"sheet": sheets[j], "response": "blank", "correct": keys[j], "points": punti_non_data[j]}
+            elif student_ans.upper() == upper_keys[j]:
+                row[j] = _CORRECT
+                correct_score += punti_corretta[j]
+                student_answers[col] = {"sheet": sheets[j], "response": student_ans, "correct": keys[j], "points": punti_corretta[j]}
             else:
-                wrong_count += 1
-                wrong_score += punto_errata
-                student_answers[col] = {"sheet": sheet_name, "response": student_ans, "correct": correct_letter, "points": punto_errata}
-                question_stats[sheet_name]["wrong"] += 1
+                row[j] = _WRONG
+                wrong_score += punti_errata[j]
+                student_answers[col] = {"sheet": sheets[j], "response": student_ans, "correct": keys[j], "points": punti_errata[j]}
+        outcome_rows.append(row)
+        answers_by_student.append(student_answers)
+        totals_by_student.append((correct_score, wrong_score, blank_score, max_possible_score))
 
-    total_score = correct_score + wrong_score + blank_score
-    percentage = round((total_score / max_possible_score) * 100, 2) if max_possible_score > 0 else 0
+    outcomes = np.array(outcome_rows, dtype=np.int8).reshape(len(submissions), num_columns)
+    correct_mask = outcomes == _CORRECT
+    wrong_mask = outcomes == _WRONG
+    blank_mask = outcomes == _BLANK
 
-    return {
-        "correct_count": correct_count,
-        "wrong_count": wrong_count,
-        "blank_count": blank_count,
-        "correct_score": correct_score,
-        "wrong_score": wrong_score,
-        "blank_score": blank_score,
-        "total_score": total_score,
-        "max_possible_score": max_possible_score,
-        "percentage": percentage,
-        "answers": student_answers,
-        "variant_id": submission.variant_id
-    }
+    correct_counts = np.count_nonzero(correct_mask, axis=1).tolist()
+    wrong_counts = np.count_nonzero(wrong_mask, axis=1).tolist()
+    blank_counts = np.count_nonzero(blank_mask, axis=1).tolist()
+    outcome_counts = np.stack([np.count_nonzero(correct_mask, axis=0),
+                               np.count_nonzero(wrong_mask, axis=0),
+                               np.count_nonzero(blank_mask, axis=0)], axis=1)
+
+    results = []
+    for i, submission in enumerate(submissions):
+        correct_score, wrong_score, blank_score, max_possible_score = totals_by_student[i]
+        total_score = correct_score + wrong_score + blank_score
+        percentage = round((total_score / max_possible_score) * 100, 2) if max_possible_score > 0 else 0
+
+        results.append({
+            "correct_count": correct_counts[i],
+            "wrong_count": wrong_counts[i],
+            "blank_count": blank_counts[i],
+            "correct_score": correct_score,
+            "wrong_score": wrong_score,
+            "blank_score": blank_score,
+            "total_score": total_score,
+            "max_possible_score": max_possible_score,
+            "percentage": percentage,
+            "answers": answers_by_student[i],
+            "variant_id": submission.variant_id
+        })
+    return results, outcome_counts
 
 def correct_tests(submissions: List[StudentSubmission],
                   variants: List[TestVariant],
@@ -164,33 +248,53 @@ def correct_tests(submissions: List[StudentSubmission],
                   variant_question_mappings: Dict[str, Dict[str, str]],
                   config: AppConfig) -> Tuple[Dict[str, Any], Dict[str, Dict[str, int]]]:
     """
-    Corregge i test per una lista di studenti.
+    Corregge i test per una lista di studenti, raggruppandoli per variante.
     """
     if not submissions:
         return {}, {}
 
     from collections import defaultdict
-    question_stats = defaultdict(lambda: {"correct": 0, "wrong": 0, "blank": 0})
-
-    variant_question_data_maps = {}
-    for variant in variants:
-        q_map = {}
-        for q in variant.questions:
-            q_map[q.sheet_name] = q
-        variant_question_data_maps[variant.variant_id] = q_map
 
-    test_results = {}
+    variants_by_id = {variant.variant_id: variant for variant in variants}
 
-    for submission in submissions:
+    groups = defaultdict(list)
+    for idx, submission in enumerate(submissions):
         variant_id = submission.variant_id
-        if variant_id not in variant_answer_keys or variant_id not in variant_question_mappings:
-            continue
+        if variant_id in variant_answer_keys and variant_id in variant_question_mappings:
+            groups[variant_id].append(idx)
 
+    results_by_index = {}
+    # Fogli nell'ordine di comparsa scorrendo le varianti (dal primo studente) e le loro colonne:
+    # con le stesse colonne per tutti, come nel template, è l'ordine delle risposte degli studenti
+    sheet_ids = {}
+    group_counts = []
+    for variant_id, indices in groups.items():
+        group = [submissions[idx] for idx in indices]
         key_mapping = variant_answer_keys[variant_id]
         question_mapping = variant_question_mappings[variant_id]
-        question_data_map = variant_question_data_maps.get(variant_id, {})
+        columns = _answer_columns(group, key_mapping, question_mapping)
+        # Mappa foglio -> domanda costruita solo per le varianti con almeno una consegna
+        variant = variants_by_id.get(variant_id)
+        question_data_map = {q.sheet_name: q for q in variant.questions} if variant is not None else {}
+        group_results, outcome_counts = score_variant_group(
+            group, columns, key_mapping, question_mapping, question_data_map, config
+        )
+        results_by_index.update(zip(indices, group_results))
+        col_sheet_ids = [sheet_ids.setdefault(question_mapping[col], len(sheet_ids)) for col in columns]
+        group_counts.append((np.array(col_sheet_ids, dtype=np.intp), outcome_counts))
 
-        result = score_single_student(submission, key_mapping, question_mapping, question_data_map, config, question_stats)
-        test_results[submission.student_id] = result
+    # Statistiche per domanda: righe = fogli, colonne = (corrette, errate, non date)
+    stats = np.zeros((len(sheet_ids), 3), dtype=np.int64)
+    for col_sheet_ids, outcome_counts in group_counts:
+        np.add.at(stats, col_sheet_ids, outcome_counts)
+    question_stats = {
+        sheet_name: dict(zip(("correct", "wrong", "blank"), stats[sheet_id].tolist()))
+        for sheet_name, sheet_id in sheet_ids.items()
+    }
+
+    # I risultati vengono inseriti nell'ordine originale degli studenti
+    test_results = {}
+    for idx in sorted(results_by_index):
+        test_results[submissions[idx].student_id] = results_by_index[idx]
 
-    return test_results, dict(question_stats)
+    return test_results, question_stats
@@ -15,6 +15,11 @@ class Question:
     punteggio_corretta: Optional[float] = None
     punteggio_errata: Optional[float] = None
     punteggio_non_data: Optional[float] = None
+    correct_index: Optional[int] = None  # Posizione della risposta corretta in answers (0 se assente)
+
+    def __post_init__(self):
+        if self.correct_index is None:
+            self.correct_index = next((i for i, ans in enumerate(self.answers) if ans.is_correct), 0)
 
 @dataclass
 class TestVariant:
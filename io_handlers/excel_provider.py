@@ -1,19 +1,29 @@
+import importlib.util
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 from typing import List, Dict, Any
 from core.models import Question, AnswerChoice, StudentSubmission
+from io_handlers.question_numbers import sorted_question_numbers
+
+# Lettore Rust per i fogli Excel se python-calamine è installato, altrimenti quello predefinito (openpyxl)
+_EXCEL_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else None
+# In scrittura si preferisce xlsxwriter se installato; le stringhe restano testo come con openpyxl
+_EXCEL_WRITER_OPTIONS = {
+    "engine": "xlsxwriter",
+    "engine_kwargs": {"options": {"strings_to_formulas": False, "strings_to_urls": False}}
+} if importlib.util.find_spec("xlsxwriter") else {}
 
 def _parse_row(selected_row: pd.Series, sheet_name: str, df_columns: List[str]) -> Question:
     question_text = str(selected_row["Testo della domanda"]).strip()
     correct_answer_text = str(selected_row["Risposta corretta"]).strip()
-    distractors = []
 
-    for col in df_columns:
-        if col.lower().startswith("alternativa"):
-            val = selected_row.get(col, "")
-            if pd.notnull(val):
-                alt_text = str(val).strip()
-                if alt_text and (alt_text != correct_answer_text):
-                    distractors.append(alt_text)
+    columns = pd.Index(df_columns)
+    alt_cols = columns[columns.astype(str).str.lower().str.startswith("alternativa")]
+    alt_vals = selected_row[alt_cols].to_numpy(dtype=object)
+    distractors = [alt_text for alt_text in (str(val).strip() for val in alt_vals[pd.notnull(alt_vals)])
+                   if alt_text and alt_text != correct_answer_text]
 
     answers = [AnswerChoice(text=correct_answer_text, is_correct=True)]
     for dist in distractors:
@@ -67,14 +77,16 @@ def _parse_row(selected_row: pd.Series, sheet_name: str, df_columns: List[str])
 
 def load_questions_from_excel(filename: str) -> List[Question]:
     try:
-        all_sheets = pd.read_excel(filename, sheet_name=None)
+        all_sheets = pd.read_excel(filename, sheet_name=None, dtype=object, engine=_EXCEL_ENGINE)
         questions_data = []
         for sheet_name, df in all_sheets.items():
             if "Testo della domanda" not in df.columns or "Risposta corretta" not in df.columns:
                 continue
-            valid_df = df[df["Testo della domanda"].notna() & df["Risposta corretta"].notna()]
-            valid_df = valid_df[valid_df["Testo della domanda"].astype(str).str.strip() != ""]
-            valid_df = valid_df[valid_df["Risposta corretta"].astype(str).str.strip() != ""]
+            question_col = df["Testo della domanda"]
+            answer_col = df["Risposta corretta"]
+            mask = (question_col.notna() & answer_col.notna() &
+                    question_col.astype(str).str.strip().ne("") & answer_col.astype(str).str.strip().ne(""))
+            valid_df = df.loc[mask]
             if valid_df.empty:
                 continue
 
@@ -87,16 +99,20 @@ def load_questions_from_excel(filename: str) -> List[Question]:
 
 def load_student_answers_from_excel(filename: str) -> List[StudentSubmission]:
     try:
-        df = pd.read_excel(filename)
+        # dtype=object: nessuna inferenza per colonna, le celle restano come lette (1 e non 1.0 se la colonna ha vuoti)
+        df = pd.read_excel(filename, dtype=object, engine=_EXCEL_ENGINE)
         required_columns = ["student_id", "variant_id"]
         missing_columns = [col for col in required_columns if col not in df.columns]
 
         if missing_columns:
             raise ValueError(f"Colonne mancanti nel file: {', '.join(missing_columns)}")
 
-        df["variant_id"] = df["variant_id"].apply(
-            lambda x: str(int(float(x))) if pd.notnull(x) and str(x).replace('.','',1).isdigit() else str(x)
-        )
+        # Gli id numerici (es. 3.0 letto da Excel) diventano "3"; gli altri restano com'erano
+        numeric_ids = pd.to_numeric(df["variant_id"], errors="coerce")
+        is_number = numeric_ids.notna() & np.isfinite(numeric_ids) & (numeric_ids >= 0)
+        variant_ids = df["variant_id"].astype(str)
+        variant_ids[is_number] = numeric_ids[is_number].astype(np.int64).astype(str)
+        df["variant_id"] = variant_ids
 
         submissions = []
         for _, row in df.iterrows():
@@ -110,11 +126,38 @@ def load_student_answers_from_excel(filename: str) -> List[StudentSubmission]:
     except Exception as e:
         raise RuntimeError(f"Errore nel caricamento delle risposte degli studenti: {str(e)}")
 
+def _write_answers_template(cols: List[str], filename: str):
+    if _EXCEL_WRITER_OPTIONS:
+        # Solo l'intestazione: con xlsxwriter si scrive la riga direttamente, senza passare da un DataFrame
+        import xlsxwriter
+        workbook = xlsxwriter.Workbook(filename, {"constant_memory": True, **_EXCEL_WRITER_OPTIONS["engine_kwargs"]["options"]})
+        worksheet = workbook.add_worksheet("Risposte")
+        worksheet.write_row(0, 0, cols)
+        workbook.close()
+        return
+    # Altrimenti openpyxl in modalità write-only: la riga viene scritta in streaming
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Risposte")
+    worksheet.append(cols)
+    workbook.save(filename)
+
 def create_student_answers_template(max_questions: int, filename: str = "student_answers.xlsx"):
-    cols = ["student_id", "variant_id"] + [str(i+1) for i in range(max_questions)]
-    df_template = pd.DataFrame(columns=cols)
-    with pd.ExcelWriter(filename) as writer:
-        df_template.to_excel(writer, sheet_name="Risposte", index=False)
+    cols = ["student_id", "variant_id"] + list(map(str, range(1, max_questions + 1)))
+    # Scrittura su un file temporaneo univoco nella stessa cartella e rinomina atomica: un'interruzione
+    # non lascia un template troncato e due esecuzioni concorrenti non si sovrascrivono il temporaneo
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", suffix=".xlsx")
+    os.close(fd)
+    try:
+        _write_answers_template(cols, tmp_filename)
+        # mkstemp crea il file con permessi 0600: si applicano quelli di un file creato normalmente
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_filename, 0o666 & ~umask)
+        os.replace(tmp_filename, filename)
+    finally:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
 
 def sanitize_for_excel(value: Any) -> Any:
     if isinstance(value, str) and value:
@@ -140,17 +183,10 @@ def generate_student_excel_report(test_results: Dict[str, Any], filename: str =
 
         answer_details = result.get("answers", {})
         answer_strings = []
-
-        for q_num in sorted(answer_details.keys(), key=int):
+        for q_num in sorted_question_numbers(tuple(answer_details)):
             ans_data = answer_details[q_num]
-            student_response = ans_data.get("response", "")
-            correct_answer = ans_data.get("correct", "")
-
-            if student_response == "blank":
-                student_response = "-"
-
-            answer_strings.append(f"{q_num}: {student_response} (corr: {correct_answer})")
-
+            student_response = "-" if ans_data["response"] == "blank" else ans_data["response"]
+            answer_strings.append(f"{q_num}: {student_response} (corr: {ans_data['correct']})")
         answers_string = ", ".join(answer_strings)
 
         row = {
@@ -179,4 +215,4 @@ def generate_student_excel_report(test_results: Dict[str, Any], filename: str =
     for col in df_report.select_dtypes(include=['object', 'string']).columns:
         df_report[col] = df_report[col].apply(sanitize_for_excel)
 
-    df_report.to_excel(filename, index=False)
+    df_report.to_excel(filename, index=False, **_EXCEL_WRITER_OPTIONS)
@@ -1,106 +1,127 @@
 import os
+import shutil
 import subprocess
-from pylatex import Document, NoEscape, Package
-from pylatex.base_classes import Environment
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 from core.models import TestVariant
 from core.config import AppConfig
 from utils.fs_ops import cleanup_latex_files
 
-class Multicols(Environment):
-    def __init__(self, columns):
-        super().__init__('multicols', arguments=[str(columns)])
+# Separatore tra i frammenti LaTeX (lo stesso di PyLaTeX): il '%' evita spazi spuri
+_LATEX_SEPARATOR = "%\n"
 
-def _setup_latex_document(config: AppConfig) -> Document:
-    doc = Document(documentclass="exam")
-    geom_opts = config.get("geometry_options", "top=1cm,bottom=0.5cm,left=1cm,right=1cm")
-    doc.packages.append(Package('geometry', options=geom_opts))
-    doc.packages.append(Package('multicol'))
-    doc.packages.append(Package('enumitem'))
-    doc.packages.append(Package('fancyhdr'))
-    doc.packages.append(Package('graphicx'))
-    doc.packages.append(Package('amsmath'))
-    doc.packages.append(Package('amssymb'))
-    doc.packages.append(Package('fancybox'))
-    doc.packages.append(Package("siunitx"))
-
-    doc.preamble.append(NoEscape(r"\renewcommand{\questionlabel}{\thequestion.\hspace{0.5em}}"))
-    doc.preamble.append(NoEscape(r"\renewcommand{\choicelabel}{(\alph{choice})\hspace{0.3em}}"))
-    doc.preamble.append(NoEscape(r"\newcommand{\um}[2]{\SI[output-decimal-marker={,}]{#1}{#2}}"))
+_PACKAGES = [
+    r"\usepackage[T1]{fontenc}",
+    r"\usepackage[utf8]{inputenc}",
+    r"\usepackage{lmodern}",
+    r"\usepackage{textcomp}",
+    r"\usepackage{lastpage}",
+]
+
+_EXTRA_PACKAGES = ["multicol", "enumitem", "fancyhdr", "graphicx", "amsmath", "amssymb", "fancybox", "siunitx"]
 
+def _latex_preamble(config: AppConfig) -> str:
+    """Preambolo comune a tutte le varianti, fino a \\begin{document} incluso."""
+    geom_opts = config.get("geometry_options", "top=1cm,bottom=0.5cm,left=1cm,right=1cm")
     header_left = config.get("firstpageheader_left", "")
     header_center = config.get("firstpageheader_center", config.get("test_header", ""))
     header_right = config.get("firstpageheader_right", "")
-    doc.preamble.append(NoEscape(r"\firstpageheader{" + header_left + "}{" + header_center + "}{" + header_right + "}"))
-    doc.preamble.append(NoEscape(r"\runningfooter{}{}{Variante~\thevariant~/~\thepage}"))
-    doc.preamble.append(NoEscape(r"\newcounter{variant}"))
 
-    return doc
-
-def _append_student_info_and_answer_grid(doc: Document, num_questions: int, variant_id: str):
-    doc.append(NoEscape(r"\noindent \textbf{\makebox[0.60\textwidth]{Nome e cognome:\enspace\hrulefill} \makebox[0.15\textwidth]{ Classe:\enspace\hrulefill} \makebox[0.20\textwidth]{ Data:\enspace\hrulefill}}"))
+    parts = [r"\documentclass{exam}"]
+    parts.extend(_PACKAGES)
+    parts.append(r"\usepackage[" + geom_opts + "]{geometry}")
+    parts.extend(r"\usepackage{" + package + "}" for package in _EXTRA_PACKAGES)
+    parts.append("")
+    parts.append(r"\renewcommand{\questionlabel}{\thequestion.\hspace{0.5em}}")
+    parts.append(r"\renewcommand{\choicelabel}{(\alph{choice})\hspace{0.3em}}")
+    parts.append(r"\newcommand{\um}[2]{\SI[output-decimal-marker={,}]{#1}{#2}}")
+    parts.append(r"\firstpageheader{" + header_left + "}{" + header_center + "}{" + header_right + "}")
+    parts.append(r"\runningfooter{}{}{Variante~\thevariant~/~\thepage}")
+    parts.append(r"\newcounter{variant}")
+    parts.append("")
+    parts.append(r"\begin{document}")
+    parts.append(r"\normalsize")
+    return _LATEX_SEPARATOR.join(parts) + _LATEX_SEPARATOR
+
+def _student_info_and_answer_grid(num_questions: int, variant_id: str) -> List[str]:
+    parts = [r"\noindent \textbf{\makebox[0.60\textwidth]{Nome e cognome:\enspace\hrulefill} \makebox[0.15\textwidth]{ Classe:\enspace\hrulefill} \makebox[0.20\textwidth]{ Data:\enspace\hrulefill}}"]
 
     cols_per_row = min(10, num_questions)
     num_rows = (num_questions + cols_per_row - 1) // cols_per_row
 
-    doc.append(NoEscape(r"\bigskip"))
-    doc.append(NoEscape(r"\noindent\textbf{Griglia Risposte (variante " + variant_id + ")}"))
+    parts.append(r"\bigskip")
+    parts.append(r"\noindent\textbf{Griglia Risposte (variante " + variant_id + ")}")
 
+    cell = r"\rule{1cm}{0pt}\rule[-0.5em]{0pt}{1.5em}"
     for row in range(num_rows):
         start_q = row * cols_per_row
         end_q = min((row + 1) * cols_per_row, num_questions)
         num_cols_in_row = end_q - start_q
 
-        grid = r"\begin{center}" + "\n" + r"\begin{tabular}{|" + "c|" * num_cols_in_row + "}" + "\n\\hline" + "\n"
-        numbers = " & ".join([str(i+1) for i in range(start_q, end_q)])
-        grid += numbers + r" \\ \hline" + "\n"
-
-        cells = " & ".join([r"\rule{1cm}{0pt}\rule[-0.5em]{0pt}{1.5em}" for _ in range(num_cols_in_row)])
-        grid += cells + r" \\ \hline" + "\n" + r"\end{tabular}" + "\n" + r"\end{center}"
-
-        doc.append(NoEscape(grid))
+        parts.append("".join([
+            r"\begin{center}", "\n",
+            r"\begin{tabular}{|", "c|" * num_cols_in_row, "}", "\n\\hline\n",
+            " & ".join([str(i + 1) for i in range(start_q, end_q)]), r" \\ \hline", "\n",
+            " & ".join([cell] * num_cols_in_row), r" \\ \hline", "\n",
+            r"\end{tabular}", "\n", r"\end{center}"
+        ]))
         if row < num_rows - 1:
-            doc.append(NoEscape(r"\vspace{0.3em}"))
+            parts.append(r"\vspace{0.3em}")
+    return parts
 
-def _generate_latex_for_variant(variant: TestVariant, config: AppConfig) -> Document:
-    doc = _setup_latex_document(config)
+def _generate_latex_for_variant(variant: TestVariant, config: AppConfig, preamble: str = None) -> str:
+    """Restituisce il sorgente .tex completo della variante."""
+    if preamble is None:
+        preamble = _latex_preamble(config)
     variant_id = variant.variant_id
 
-    doc.append(NoEscape(r"\setcounter{variant}{" + variant_id + "}"))
-    num_questions = len(variant.questions)
-    _append_student_info_and_answer_grid(doc, num_questions, variant_id)
+    parts = [r"\setcounter{variant}{" + variant_id + "}"]
+    parts.extend(_student_info_and_answer_grid(len(variant.questions), variant_id))
 
-    doc.append(NoEscape(r"\vspace{1em}"))
-    doc.append(NoEscape(r"\begin{questions}"))
+    parts.append(r"\vspace{1em}")
+    parts.append(r"\begin{questions}")
 
     for question in variant.questions:
-        qcmd = r"\question " + question.question_text
-        doc.append(NoEscape(qcmd))
-        doc.append(NoEscape(r"\vspace{0.2em}"))
+        parts.append(r"\question " + question.question_text)
+        parts.append(r"\vspace{0.2em}")
         if question.answers:
             num_cols = question.num_columns_alternatives
             if num_cols > 1:
-                doc.append(NoEscape(r"\begin{multicols}{" + str(num_cols) + "}"))
-            doc.append(NoEscape(r"\begin{choices}"))
-            for ans in question.answers:
-                doc.append(NoEscape(r"\choice " + ans.text))
-            doc.append(NoEscape(r"\end{choices}"))
+                parts.append(r"\begin{multicols}{" + str(num_cols) + "}")
+            parts.append(r"\begin{choices}")
+            parts.extend(r"\choice " + ans.text for ans in question.answers)
+            parts.append(r"\end{choices}")
             if num_cols > 1:
-                doc.append(NoEscape(r"\end{multicols}"))
-
-    doc.append(NoEscape(r"\end{questions}"))
-    return doc
-
-def compile_latex_to_pdf(latex_obj: Document, output_filename_base: str) -> bool:
+                parts.append(r"\end{multicols}")
+
+    parts.append(r"\end{questions}")
+    return preamble + _LATEX_SEPARATOR.join(parts) + _LATEX_SEPARATOR + r"\end{document}"
+
+def _latex_commands(tex_filename: str) -> List[List[str]]:
+    """
+    latexmk esegue solo i passaggi necessari (confrontando i file .aux); se non è
+    disponibile si ricade sulle due esecuzioni fisse di pdflatex.
+    """
+    if shutil.which("latexmk"):
+        return [["latexmk", "-pdf", "-no-shell-escape", "-interaction=nonstopmode", "-synctex=0",
+                 "-file-line-error", "-output-directory=tests_pdf", tex_filename]]
+    pdflatex = ["pdflatex", "-no-shell-escape", "-interaction=nonstopmode", "-output-directory=tests_pdf", tex_filename]
+    return [pdflatex, pdflatex]
+
+def compile_latex_to_pdf(tex_source: str, output_filename_base: str) -> bool:
     tex_filename = f"{output_filename_base}.tex"
     pdf_filename = f"{os.path.basename(output_filename_base)}.pdf"
     try:
-        latex_obj.generate_tex(output_filename_base)
-        for _ in range(2):
+        with open(tex_filename, "w", encoding="utf-8") as f:
+            f.write(tex_source)
+        env = dict(os.environ, MKTEXFMT="0")
+        for command in _latex_commands(tex_filename):
             subprocess.run(
-                ["pdflatex", "-no-shell-escape", "-interaction=nonstopmode", f"-output-directory=tests_pdf", tex_filename],
+                command,
                 capture_output=True,
                 text=True,
-                timeout=30
+                timeout=60 if command[0] == "latexmk" else 30,
+                env=env
             )
         pdf_path = os.path.join("tests_pdf", pdf_filename)
         return os.path.exists(pdf_path)
@@ -108,3 +129,20 @@ def compile_latex_to_pdf(latex_obj: Document, output_filename_base: str) -> bool
         return False
     finally:
         cleanup_latex_files(output_filename_base)
+
+def _build_one_variant(variant: TestVariant, config: AppConfig, preamble: str) -> bool:
+    output_base = os.path.join("tests_tex", f"test_variant_{variant.variant_id}")
+    tex_source = _generate_latex_for_variant(variant, config, preamble)
+    return compile_latex_to_pdf(tex_source, output_base)
+
+def generate_test_pdfs(variants: List[TestVariant], config: AppConfig, max_workers: int = None) -> List[str]:
+    """
+    Genera e compila i PDF di tutte le varianti in parallelo (un processo pdflatex per variante).
+    Restituisce gli id delle varianti la cui compilazione non ha prodotto il PDF.
+    """
+    if not variants:
+        return []
+    preamble = _latex_preamble(config)
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        results = list(executor.map(lambda v: _build_one_variant(v, config, preamble), variants))
+    return [v.variant_id for v, success in zip(variants, results) if not success]
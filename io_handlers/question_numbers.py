@@ -0,0 +1,10 @@
+from functools import lru_cache
+from typing import Tuple
+
+@lru_cache(maxsize=1024)
+def sorted_question_numbers(question_numbers: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Numeri di domanda ("1", "2", ..., "10") in ordine numerico. Tutti gli studenti e le varianti
+    con le stesse domande condividono lo stesso ordinamento, calcolato una volta sola.
+    """
+    return tuple(sorted(question_numbers, key=int))
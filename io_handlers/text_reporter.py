@@ -1,11 +1,11 @@
 import os
 import json
-import re
 import numpy as np
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from typing import List, Dict, Any
 from core.models import TestVariant
 from core.config import AppConfig
+from io_handlers.question_numbers import sorted_question_numbers
 
 def generate_answer_keys_report(variants: List[TestVariant], config: AppConfig) -> tuple:
     label_style = config.get('choice_label_format', 'letters_upper')
@@ -24,7 +24,7 @@ def generate_answer_keys_report(variants: List[TestVariant], config: AppConfig)
             sheet_name = question.sheet_name
             question_mapping[question_num] = sheet_name
 
-            correct_idx = next((i for i, ans in enumerate(question.answers) if ans.is_correct), 0)
+            correct_idx = question.correct_index
 
             if label_style == "letters_upper":
                 key = chr(ord('A') + correct_idx)
@@ -38,7 +38,7 @@ def generate_answer_keys_report(variants: List[TestVariant], config: AppConfig)
         variant_answer_keys[variant_id] = key_mapping
         variant_question_mappings[variant_id] = question_mapping
 
-        line = f"Variante {variant_id}: " + " ".join([f"Domanda {qnum}: {key_mapping[qnum]} ({question_mapping[qnum]})" for qnum in sorted(key_mapping.keys(), key=int)])
+        line = f"Variante {variant_id}: " + " ".join([f"Domanda {qnum}: {key_mapping[qnum]} ({question_mapping[qnum]})" for qnum in sorted_question_numbers(tuple(key_mapping))])
         report_lines.append(line)
 
     with open("answer_keys_report.txt", "w", encoding="utf-8") as f:
@@ -53,21 +53,38 @@ def generate_answer_keys_report(variants: List[TestVariant], config: AppConfig)
 
     return variant_answer_keys, variant_question_mappings
 
-def _create_question_pie_chart(sheet_name: str, stats: Dict[str, Any]):
-    plt.figure(figsize=(8, 6))
+# Caratteri non ammessi nei nomi file, rimossi dal nome del foglio
+_UNSAFE_FILENAME_CHARS = str.maketrans('', '', '\\/*?:"<>|')
+
+def _new_figure(figsize: tuple):
+    # matplotlib si importa solo quando serve un grafico: la fase 1 e i test non ne pagano il costo.
+    # Con Figure (senza pyplot) il salvataggio usa il canvas Agg, senza backend grafico
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+def _create_question_pie_chart(fig, sheet_name: str, stats: Dict[str, Any], out_dir: str = "report_questions"):
+    ax = fig.axes[0]
+    ax.clear()
     labels = ['Corrette', 'Errate', 'Non Date']
     sizes = [stats.get('correct_pct', 0), stats.get('wrong_pct', 0), stats.get('blank_pct', 0)]
     colors = ['green', 'red', 'gray']
     explode = (0.1, 0, 0)
-    plt.pie(sizes, explode=explode, labels=labels, colors=colors, autopct='%1.1f%%', shadow=True, startangle=140)
-    plt.axis('equal')
-    plt.title(f'Distribuzione Risposte - Domanda: {sheet_name}')
-    safe_name = re.sub(r'[\\/*?:"<>|]', "", sheet_name)
-    plt.savefig(os.path.join("report_questions", f"question_{safe_name}.png"), dpi=300, bbox_inches='tight')
-    plt.close()
+    ax.pie(sizes, explode=explode, labels=labels, colors=colors, autopct='%1.1f%%', shadow=True, startangle=140)
+    ax.axis('equal')
+    ax.set_title(f'Distribuzione Risposte - Domanda: {sheet_name}')
+    safe_name = sheet_name.translate(_UNSAFE_FILENAME_CHARS)
+    fig.savefig(os.path.join(out_dir, f"question_{safe_name}.png"), dpi=300, bbox_inches='tight')
+
+def _create_question_pie_chart_batch(question_stats: List[tuple], out_dir: str):
+    # Una figura per lotto, riutilizzata per tutti i grafici del lotto e poi rilasciata
+    fig = _new_figure((8, 6))
+    fig.add_subplot()
+    for sheet_name, stats in question_stats:
+        _create_question_pie_chart(fig, sheet_name, stats, out_dir)
 
 def _create_stacked_bar_chart(data: Dict[str, List[Any]]):
-    plt.figure(figsize=(12, 8))
+    fig = _new_figure((12, 8))
+    ax = fig.add_subplot()
     domande = data["domande"]
     corrette = np.array(data["correct"])
     non_date = np.array(data["blank"])
@@ -79,19 +96,40 @@ def _create_stacked_bar_chart(data: Dict[str, List[Any]]):
         non_date = (non_date / total) * 100
         errate = (errate / total) * 100
     indices = np.arange(len(domande))
-    plt.bar(indices, corrette, bar_width, color='green', label='Corrette')
-    plt.bar(indices, non_date, bar_width, bottom=corrette, color='gray', label='Non Date')
-    plt.bar(indices, errate, bar_width, bottom=corrette+non_date, color='red', label='Errate')
-    plt.xlabel('Domande')
-    plt.ylabel('Percentuale (%)')
-    plt.title('Distribuzione Risposte per Domanda')
-    plt.xticks(indices, domande, rotation=45, ha='right')
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(os.path.join("report_questions", "all_questions_stacked.png"), dpi=300, bbox_inches='tight')
-    plt.close()
-
-def generate_question_report(question_analytics: Dict[str, Dict[str, Any]], analysis_results: Dict[str, Any]):
+    ax.bar(indices, corrette, bar_width, color='green', label='Corrette')
+    ax.bar(indices, non_date, bar_width, bottom=corrette, color='gray', label='Non Date')
+    ax.bar(indices, errate, bar_width, bottom=corrette+non_date, color='red', label='Errate')
+    ax.set_xlabel('Domande')
+    ax.set_ylabel('Percentuale (%)')
+    ax.set_title('Distribuzione Risposte per Domanda')
+    ax.set_xticks(indices, domande, rotation=45, ha='right')
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(os.path.join("report_questions", "all_questions_stacked.png"), dpi=300, bbox_inches='tight')
+
+def _create_question_pie_charts(question_stats: List[tuple], out_dir: str, max_workers: int = None):
+    """
+    Disegna i grafici a torta delle domande in processi separati (il rendering è CPU-bound:
+    con il GIL dei thread non girerebbero in parallelo); con un solo grafico o un solo core
+    non vale la pena avviare il pool.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, len(question_stats))
+    if max_workers <= 1:
+        _create_question_pie_chart_batch(question_stats, out_dir)
+        return
+    # Un lotto di domande per processo: ciascuno crea e riusa la propria figura
+    batches = [[(sheet_name, dict(stats)) for sheet_name, stats in question_stats[i::max_workers]]
+               for i in range(max_workers)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_create_question_pie_chart_batch, batches, [out_dir] * len(batches)))
+
+# Valutazione di difficoltà e discriminazione: np.digitize sulle soglie dà l'indice dell'etichetta
+_DIFFICULTY_THRESHOLDS = [0.3, 0.7]
+_DIFFICULTY_RATINGS = np.array(["Facile", "Media", "Difficile"])
+_DISCRIMINATION_THRESHOLDS = [0, 0.2, 0.4]
+_DISCRIMINATION_RATINGS = np.array(["Negativa (problematica)", "Scarsa", "Buona", "Eccellente"])
+
+def generate_question_report(question_analytics: Dict[str, Dict[str, Any]], analysis_results: Dict[str, Any], max_workers: int = None):
     if not question_analytics:
         return
 
@@ -104,7 +142,14 @@ def generate_question_report(question_analytics: Dict[str, Dict[str, Any]], anal
 
     all_questions_data = {"domande": [], "correct": [], "blank": [], "wrong": []}
 
-    for sheet_name, stats in sorted(question_analytics.items()):
+    sorted_questions = sorted(question_analytics.items())
+    # Valutazioni di tutte le domande in un'unica classificazione per soglie
+    difficulty_ratings = _DIFFICULTY_RATINGS[np.digitize(
+        [stats.get('difficulty', 0) for _, stats in sorted_questions], _DIFFICULTY_THRESHOLDS)].tolist()
+    discrimination_ratings = _DISCRIMINATION_RATINGS[np.digitize(
+        [stats.get('discrimination', 0) for _, stats in sorted_questions], _DISCRIMINATION_THRESHOLDS)].tolist()
+
+    for (sheet_name, stats), difficulty_rating, discrimination_rating in zip(sorted_questions, difficulty_ratings, discrimination_ratings):
         lines.append(f"\n== Domanda: {sheet_name} ==")
         lines.append(f"Risposte corrette: {stats.get('correct', 0)} ({stats.get('correct_pct', 0)}%)")
         lines.append(f"Risposte errate: {stats.get('wrong', 0)} ({stats.get('wrong_pct', 0)}%)")
@@ -112,62 +157,65 @@ def generate_question_report(question_analytics: Dict[str, Dict[str, Any]], anal
         lines.append(f"Indice di difficoltà: {stats.get('difficulty', 0)} (0=facile, 1=difficile)")
         lines.append(f"Indice di discriminazione: {stats.get('discrimination', 0)} (-1=negativo, 1=positivo)")
 
-        difficulty_rating = "Facile" if stats.get('difficulty', 0) < 0.3 else ("Media" if stats.get('difficulty', 0) < 0.7 else "Difficile")
-        disc = stats.get('discrimination', 0)
-        discrimination_rating = "Negativa (problematica)" if disc < 0 else ("Scarsa" if disc < 0.2 else ("Buona" if disc < 0.4 else "Eccellente"))
-
         lines.append(f"Valutazione difficoltà: {difficulty_rating}")
         lines.append(f"Valutazione discriminazione: {discrimination_rating}")
 
-        _create_question_pie_chart(sheet_name, stats)
         all_questions_data["domande"].append(sheet_name)
         all_questions_data["correct"].append(stats.get('correct_pct', 0))
         all_questions_data["blank"].append(stats.get('blank_pct', 0))
         all_questions_data["wrong"].append(stats.get('wrong_pct', 0))
 
+    _create_question_pie_charts(sorted_questions, "report_questions", max_workers)
     _create_stacked_bar_chart(all_questions_data)
     with open(os.path.join("report_questions", "report_quest.txt"), "w", encoding="utf-8") as f:
         f.write("\n".join(lines))
 
 def _create_score_distribution_chart(test_results: Dict[str, Any], analysis_results: Dict[str, Any]):
-    scores = [res["total_score"] for res in test_results.values()]
-    plt.figure(figsize=(10, 6))
-    plt.hist(scores, bins=10, color='skyblue', edgecolor='black', alpha=0.7)
-    plt.axvline(analysis_results.get('average_score', 0), color='red', linestyle='--', linewidth=2, label='Media')
-    plt.axvline(analysis_results.get('median_score', 0), color='green', linestyle='-', linewidth=2, label='Mediana')
-    max_scores = [res["max_possible_score"] for res in test_results.values()]
-    avg_max = np.mean(max_scores) if max_scores else 0
+    n = len(test_results)
+    scores = np.fromiter((res["total_score"] for res in test_results.values()), dtype=np.float64, count=n)
+    max_scores = np.fromiter((res["max_possible_score"] for res in test_results.values()), dtype=np.float64, count=n)
+    fig = _new_figure((10, 6))
+    ax = fig.add_subplot()
+    ax.hist(scores, bins=10, color='skyblue', edgecolor='black', alpha=0.7)
+    ax.axvline(analysis_results.get('average_score', 0), color='red', linestyle='--', linewidth=2, label='Media')
+    ax.axvline(analysis_results.get('median_score', 0), color='green', linestyle='-', linewidth=2, label='Mediana')
+    avg_max = max_scores.mean() if n else 0
     pass_threshold = avg_max * (analysis_results.get('passing_threshold', 0) / 100)
-    plt.axvline(pass_threshold, color='orange', linestyle='-.', linewidth=2, label='Soglia Sufficienza')
-    plt.xlabel('Punteggio')
-    plt.ylabel('Numero di Studenti')
-    plt.title('Distribuzione dei Punteggi')
-    plt.legend()
-    plt.tight_layout()
+    ax.axvline(pass_threshold, color='orange', linestyle='-.', linewidth=2, label='Soglia Sufficienza')
+    ax.set_xlabel('Punteggio')
+    ax.set_ylabel('Numero di Studenti')
+    ax.set_title('Distribuzione dei Punteggi')
+    ax.legend()
+    fig.tight_layout()
     os.makedirs("report_questions", exist_ok=True)
-    plt.savefig(os.path.join("report_questions", "score_distribution.png"), dpi=300, bbox_inches='tight')
-    plt.close()
+    fig.savefig(os.path.join("report_questions", "score_distribution.png"), dpi=300, bbox_inches='tight')
+
+# Righe "Statistiche Generali" del report studenti: (etichetta, chiave in analysis_results, default, suffisso)
+_GENERAL_STATISTICS_LINES = (
+    ("Numero di studenti", "num_students", 0, ""),
+    ("Punteggio medio", "average_score", 0, ""),
+    ("Punteggio mediano", "median_score", 0, ""),
+    ("Deviazione standard", "std_deviation", 0, ""),
+    ("Punteggio minimo", "min_score", 0, ""),
+    ("Punteggio massimo", "max_score", 0, ""),
+    ("Quartili (25%, 50%, 75%)", "quartiles", [0, 0, 0], ""),
+    ("Soglia di sufficienza", "passing_threshold", 0, "%"),
+    ("Percentuale di promossi", "pass_rate", 0, "%"),
+    ("Media risposte corrette", "avg_correct_count", 0, ""),
+    ("Media risposte errate", "avg_wrong_count", 0, ""),
+    ("Media risposte non date", "avg_blank_count", 0, ""),
+    ("Media punti risposte corrette", "avg_correct_score", 0, ""),
+    ("Media punti risposte errate", "avg_wrong_score", 0, ""),
+    ("Media punti risposte non date", "avg_blank_score", 0, "\n"),
+)
 
 def generate_student_report(test_results: Dict[str, Any], analysis_results: Dict[str, Any]):
     if not test_results:
         return
 
     lines = ["=== Report degli Studenti ===\n", "Statistiche Generali:"]
-    lines.append(f"Numero di studenti: {analysis_results.get('num_students', 0)}")
-    lines.append(f"Punteggio medio: {analysis_results.get('average_score', 0)}")
-    lines.append(f"Punteggio mediano: {analysis_results.get('median_score', 0)}")
-    lines.append(f"Deviazione standard: {analysis_results.get('std_deviation', 0)}")
-    lines.append(f"Punteggio minimo: {analysis_results.get('min_score', 0)}")
-    lines.append(f"Punteggio massimo: {analysis_results.get('max_score', 0)}")
-    lines.append(f"Quartili (25%, 50%, 75%): {analysis_results.get('quartiles', [0, 0, 0])}")
-    lines.append(f"Soglia di sufficienza: {analysis_results.get('passing_threshold', 0)}%")
-    lines.append(f"Percentuale di promossi: {analysis_results.get('pass_rate', 0)}%")
-    lines.append(f"Media risposte corrette: {analysis_results.get('avg_correct_count', 0)}")
-    lines.append(f"Media risposte errate: {analysis_results.get('avg_wrong_count', 0)}")
-    lines.append(f"Media risposte non date: {analysis_results.get('avg_blank_count', 0)}")
-    lines.append(f"Media punti risposte corrette: {analysis_results.get('avg_correct_score', 0)}")
-    lines.append(f"Media punti risposte errate: {analysis_results.get('avg_wrong_score', 0)}")
-    lines.append(f"Media punti risposte non date: {analysis_results.get('avg_blank_score', 0)}\n")
+    lines.extend(f"{label}: {analysis_results.get(key, default)}{suffix}"
+                 for label, key, default, suffix in _GENERAL_STATISTICS_LINES)
 
     _create_score_distribution_chart(test_results, analysis_results)
 
@@ -178,11 +226,13 @@ def generate_student_report(test_results: Dict[str, Any], analysis_results: Dict
     # Sort results
     sorted_results = sorted(test_results.items(), key=lambda x: x[1]['total_score'], reverse=True)
 
-    for student_id, res in sorted_results:
-        line = f"{student_id} | {res.get('variant_id')} | {res.get('correct_count')} | {res.get('wrong_count')} | {res.get('blank_count')} | "
-        line += f"{res.get('correct_score')} | {res.get('wrong_score')} | {res.get('blank_score')} | {res.get('total_score')} | {res.get('max_possible_score')} | "
-        line += f"{res.get('percentage')}% | {res.get('percentile', 0)} | {res.get('z_score', 0)} | {res.get('stanine', '')}"
-        lines.append(line)
+    # I campi di correct_tests ci sono sempre; percentile, z e stanine solo dopo analyze_results
+    lines.extend(
+        f"{student_id} | {res['variant_id']} | {res['correct_count']} | {res['wrong_count']} | {res['blank_count']} | "
+        f"{res['correct_score']} | {res['wrong_score']} | {res['blank_score']} | {res['total_score']} | {res['max_possible_score']} | "
+        f"{res['percentage']}% | {res.get('percentile', 0)} | {res.get('z_score', 0)} | {res.get('stanine', '')}"
+        for student_id, res in sorted_results
+    )
 
     with open("report_students.txt", "w", encoding="utf-8") as f:
         f.write("\n".join(lines))
@@ -201,7 +251,7 @@ def generate_teacher_report(analysis_results: Dict[str, Any], variant_answer_key
         key_mapping = variant_answer_keys[variant_id]
         question_mapping = variant_question_mappings[variant_id]
         lines.append(f"\nVariante {variant_id}:")
-        for q_num in sorted(key_mapping.keys(), key=int):
+        for q_num in sorted_question_numbers(tuple(key_mapping)):
             sheet_name = question_mapping.get(q_num, "Sconosciuta")
             answer_key = key_mapping.get(q_num, "?")
             lines.append(f"Domanda {q_num}: Risposta {answer_key} (Foglio: {sheet_name})")
@@ -209,52 +259,49 @@ def generate_teacher_report(analysis_results: Dict[str, Any], variant_answer_key
     with open("teacher_report.txt", "w", encoding="utf-8") as f:
         f.write("\n".join(lines))
 
-def _generate_student_report_text(test_results: Dict[str, Any]) -> str:
-    all_lines = ["=== Report Dettagliato degli Studenti ===\n"]
-    student_ids = sorted(test_results.keys(), key=lambda s: test_results[s]["total_score"], reverse=True)
+def _student_report_lines(student_id: str, result: Dict[str, Any]) -> List[str]:
+    variant_id = result["variant_id"]
 
-    for student_id in student_ids:
-        result = test_results[student_id]
-        variant_id = result["variant_id"]
-
-        lines = [f"\n---- Studente: {student_id} ----"]
-        lines.append(f"Variante del test: {variant_id}")
-        lines.append(f"\nPunteggio totale: {result['total_score']} su {result['max_possible_score']} ({result['percentage']}%)")
-        lines.append(f"Punti da risposte corrette: {result['correct_score']} (n. risposte: {result['correct_count']})")
-        lines.append(f"Punti da risposte errate: {result['wrong_score']} (n. risposte: {result['wrong_count']})")
-        lines.append(f"Punti da risposte non date: {result['blank_score']} (n. risposte: {result['blank_count']})")
-
-        lines.append(f"\nConfrontato con la classe:")
-        lines.append(f"Percentile: {result.get('percentile', 0)} (0-100)")
-        lines.append(f"Z-Score: {result.get('z_score', 0)} (distanza dalla media in unità di deviazione standard)")
-        lines.append(f"Stanine: {result.get('stanine', '')} (F- = peggiore, S+ = migliore)")
-
-        lines.append("\nDettaglio risposte:")
-        answer_details = result.get("answers", {})
-
-        for q_num in sorted(answer_details.keys(), key=int):
-            ans_data = answer_details[q_num]
-            sheet_name = ans_data.get("sheet", "Sconosciuta")
-            student_response = ans_data.get("response", "")
-            correct_answer = ans_data.get("correct", "")
-            points = ans_data.get("points", 0)
-
-            if student_response == "blank":
-                status = f"NON DATA (punti: {points})"
-            elif student_response.upper() == correct_answer.upper():
-                status = f"CORRETTA (punti: {points})"
-            else:
-                status = f"ERRATA - Risposta corretta: {correct_answer} (punti: {points})"
+    lines = [f"\n---- Studente: {student_id} ----"]
+    lines.append(f"Variante del test: {variant_id}")
+    lines.append(f"\nPunteggio totale: {result['total_score']} su {result['max_possible_score']} ({result['percentage']}%)")
+    lines.append(f"Punti da risposte corrette: {result['correct_score']} (n. risposte: {result['correct_count']})")
+    lines.append(f"Punti da risposte errate: {result['wrong_score']} (n. risposte: {result['wrong_count']})")
+    lines.append(f"Punti da risposte non date: {result['blank_score']} (n. risposte: {result['blank_count']})")
+
+    lines.append(f"\nConfrontato con la classe:")
+    lines.append(f"Percentile: {result.get('percentile', 0)} (0-100)")
+    lines.append(f"Z-Score: {result.get('z_score', 0)} (distanza dalla media in unità di deviazione standard)")
+    lines.append(f"Stanine: {result.get('stanine', '')} (F- = peggiore, S+ = migliore)")
 
-            lines.append(f"Domanda {q_num} ({sheet_name}): Risposta: {student_response} - {status}")
+    lines.append("\nDettaglio risposte:")
+    answer_details = result.get("answers", {})
 
-        all_lines.extend(lines)
+    for q_num in sorted_question_numbers(tuple(answer_details)):
+        ans_data = answer_details[q_num]
+        sheet_name = ans_data.get("sheet", "Sconosciuta")
+        student_response = ans_data.get("response", "")
+        correct_answer = ans_data.get("correct", "")
+        points = ans_data.get("points", 0)
 
-    return "\n".join(all_lines)
+        if student_response == "blank":
+            status = f"NON DATA (punti: {points})"
+        elif student_response.upper() == correct_answer.upper():
+            status = f"CORRETTA (punti: {points})"
+        else:
+            status = f"ERRATA - Risposta corretta: {correct_answer} (punti: {points})"
+
+        lines.append(f"Domanda {q_num} ({sheet_name}): Risposta: {student_response} - {status}")
+
+    return lines
 
 def generate_student_reports(test_results: Dict[str, Any]):
     if not test_results:
         return
-    report_text = _generate_student_report_text(test_results)
+    student_ids = sorted(test_results.keys(), key=lambda s: test_results[s]["total_score"], reverse=True)
+    # Un blocco per studente scritto subito su file, senza tenere in memoria l'intero report
     with open("report_students_detailed.txt", "w", encoding="utf-8") as f:
-        f.write(report_text)
+        f.write("=== Report Dettagliato degli Studenti ===\n")
+        for student_id in student_ids:
+            f.write("\n")
+            f.write("\n".join(_student_report_lines(student_id, test_results[student_id])))
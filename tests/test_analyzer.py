@@ -1,8 +1,40 @@
 import pytest
 from core.logic import correct_tests
+from core.analyzer import analyze_questions, analyze_results
 
 def test_correct_tests_early_return():
     """Test that correct_tests returns early when student_responses is empty."""
     res, stats = correct_tests([], [], {}, {}, None)
     assert res == {}
     assert stats == {}
+
+def test_analyze_questions_discrimination_case_insensitive():
+    def result(total, answers):
+        return {"total_score": total, "answers": {
+            q: {"sheet": sheet, "response": response, "correct": correct} for q, (sheet, response, correct) in answers.items()
+        }}
+
+    test_results = {
+        "S1": result(3, {"1": ("S1", "a", "A"), "2": ("S2", "B", "B")}),
+        "S2": result(2, {"1": ("S1", "A", "A"), "2": ("S2", "blank", "B")}),
+        "S3": result(0, {"1": ("S1", "C", "A"), "2": ("S2", "b", "B")}),
+    }
+    question_analytics = {"S1": {"correct": 2, "wrong": 1, "blank": 0}, "S2": {"correct": 2, "wrong": 0, "blank": 1}}
+
+    analytics = analyze_questions(test_results, question_analytics)
+
+    assert analytics["S1"]["discrimination"] == 1.0
+    assert analytics["S2"]["discrimination"] == 0.0
+
+def test_analyze_results_percentile_and_stanine_with_ties():
+    def result(total):
+        return {"total_score": total, "percentage": total * 10, "correct_score": total, "wrong_score": 0, "blank_score": 0,
+                "correct_count": 0, "wrong_count": 0, "blank_count": 0}
+
+    test_results = {"S1": result(2), "S2": result(5), "S3": result(5), "S4": result(9)}
+
+    analyze_results(test_results, 0.6)
+
+    assert [r["percentile"] for r in test_results.values()] == [25.0, 62.5, 62.5, 100.0]
+    assert [r["stanine"] for r in test_results.values()] == ["F-", "B", "B", "S+"]
+    assert test_results["S1"]["z_score"] == round((2 - 5.25) / 2.4869660230891797, 2)
@@ -2,19 +2,22 @@ import pytest
 from unittest.mock import patch
 import sys
 
-# Mock sys.modules for pylatex since the example may not have pylatex installed
-import sys
-from unittest.mock import MagicMock
-sys.modules['pylatex'] = MagicMock()
-sys.modules['pylatex.base_classes'] = MagicMock()
+# Stub sys.modules for pylatex since the example may not have pylatex installed.
+# Plain module objects are enough: only the imported names must exist.
+import types
 
-# Instead of letting pylatex.base_classes.Environment be a MagicMock object,
-# which causes a metaclass conflict if inherited from, we create a dummy class
+# Environment must be a real class, since the example inherits from it
 class DummyEnvironment:
     def __init__(self, *args, **kwargs):
         pass
 
-sys.modules['pylatex.base_classes'].Environment = DummyEnvironment
+def _stub_module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+sys.modules['pylatex'] = _stub_module('pylatex', Document=DummyEnvironment, NoEscape=str, Package=DummyEnvironment)
+sys.modules['pylatex.base_classes'] = _stub_module('pylatex.base_classes', Environment=DummyEnvironment)
 
 from example.randomizer import TestGeneratorAnalyzer
 
@@ -1,7 +1,7 @@
 import pytest
 import pandas as pd
 from unittest.mock import patch, MagicMock
-from io_handlers.excel_provider import load_questions_from_excel, _parse_row, load_student_answers_from_excel
+from io_handlers.excel_provider import load_questions_from_excel, _parse_row, load_student_answers_from_excel, create_student_answers_template
 from core.models import StudentSubmission
 
 def test_parse_row_edge_cases():
@@ -84,3 +84,46 @@ def test_load_student_answers_success(mock_read_excel):
     assert submissions[1].student_id == "S002"
     assert submissions[1].variant_id == "2"
     assert submissions[1].answers == {"1": "C", "2": "D"}
+
+def test_load_questions_keeps_integer_answers_as_text(tmp_path):
+    filename = tmp_path / "questions.xlsx"
+    pd.DataFrame({
+        "Testo della domanda": ["Quanto fa 2+2?", None],
+        "Risposta corretta": [4, None],
+        "Alternativa 1": [3, None]
+    }).to_excel(filename, sheet_name="Somma", index=False)
+
+    questions = load_questions_from_excel(str(filename))
+
+    assert len(questions) == 1
+    assert [a.text for a in questions[0].answers] == ["4", "3"]
+
+def test_load_student_answers_keeps_integer_cells_with_blanks(tmp_path):
+    filename = tmp_path / "student_answers.xlsx"
+    pd.DataFrame({
+        "student_id": [1001, 1002],
+        "variant_id": [1, 2],
+        "1": [2, None],
+        "2": ["A", "B"]
+    }).to_excel(filename, sheet_name="Risposte", index=False)
+
+    submissions = load_student_answers_from_excel(str(filename))
+
+    assert [s.student_id for s in submissions] == ["1001", "1002"]
+    assert submissions[0].answers == {"1": "2", "2": "A"}
+    assert submissions[1].answers == {"1": "nan", "2": "B"}
+
+def test_create_student_answers_template_keeps_previous_file_on_failure(tmp_path):
+    filename = tmp_path / "student_answers.xlsx"
+    create_student_answers_template(2, str(filename))
+
+    assert list(pd.read_excel(filename, sheet_name="Risposte").columns) == ["student_id", "variant_id", "1", "2"]
+    assert list(tmp_path.iterdir()) == [filename]
+
+    previous = filename.read_bytes()
+    with patch("io_handlers.excel_provider._write_answers_template", side_effect=OSError("disco pieno")):
+        with pytest.raises(OSError):
+            create_student_answers_template(5, str(filename))
+
+    assert filename.read_bytes() == previous
+    assert list(tmp_path.iterdir()) == [filename]
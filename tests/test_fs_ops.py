@@ -0,0 +1,14 @@
+from utils.fs_ops import cleanup_latex_files
+
+def test_cleanup_latex_files_removes_only_matching_temp_files(tmp_path):
+    names = ["test_variant_1.aux", "test_variant_1.log", "test_variant_1.fdb_latexmk",
+             "test_variant_1.tex", "test_variant_1.pdf", "test_variant_10.aux"]
+    for name in names:
+        (tmp_path / name).write_text("")
+
+    cleanup_latex_files(str(tmp_path / "test_variant_1"))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["test_variant_1.pdf", "test_variant_1.tex", "test_variant_10.aux"]
+
+def test_cleanup_latex_files_missing_directory(tmp_path):
+    cleanup_latex_files(str(tmp_path / "missing" / "test_variant_1"))
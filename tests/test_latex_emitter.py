@@ -0,0 +1,34 @@
+import os
+from unittest.mock import patch, MagicMock
+from core.models import TestVariant as Variant, Question, AnswerChoice
+from io_handlers.latex_emitter import generate_test_pdfs, _generate_latex_for_variant
+
+def _config(**values):
+    return MagicMock(get=lambda key, default=None: values.get(key, default))
+
+def test_generate_test_pdfs_reports_failed_variants():
+    variants = [Variant(variant_id=str(i), questions=[]) for i in range(1, 6)]
+
+    with patch("io_handlers.latex_emitter._generate_latex_for_variant") as mock_generate, \
+         patch("io_handlers.latex_emitter.compile_latex_to_pdf", side_effect=lambda obj, base: not base.endswith(("_2", "_4"))) as mock_compile:
+        failed = generate_test_pdfs(variants, _config(), max_workers=3)
+
+    assert failed == ["2", "4"]
+    assert mock_generate.call_count == 5
+    compiled = sorted(call.args[1] for call in mock_compile.call_args_list)
+    assert compiled == sorted(os.path.join("tests_tex", f"test_variant_{i}") for i in range(1, 6))
+
+def test_generate_latex_for_variant_document_structure():
+    variant = Variant(variant_id="7", questions=[
+        Question("Quanto fa $2+2$?", "S1", [AnswerChoice("4", True), AnswerChoice("5")], num_columns_alternatives=2)
+    ])
+
+    tex = _generate_latex_for_variant(variant, _config(test_header="Verifica"))
+
+    assert tex.startswith("\\documentclass{exam}%\n")
+    assert "\\usepackage[top=1cm,bottom=0.5cm,left=1cm,right=1cm]{geometry}%\n" in tex
+    assert "\\firstpageheader{}{Verifica}{}%\n" in tex
+    assert "\\begin{document}%\n\\normalsize%\n\\setcounter{variant}{7}%\n" in tex
+    assert "\\question Quanto fa $2+2$?%\n\\vspace{0.2em}%\n\\begin{multicols}{2}%\n\\begin{choices}%\n" in tex
+    assert "\\choice 4%\n\\choice 5%\n\\end{choices}%\n\\end{multicols}%\n" in tex
+    assert tex.endswith("\\end{questions}%\n\\end{document}")
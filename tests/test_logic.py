@@ -1,6 +1,7 @@
 import random
-from core.models import Question, AnswerChoice
-from core.logic import generate_test_variants
+from unittest.mock import MagicMock
+from core.models import Question, AnswerChoice, TestVariant as Variant, StudentSubmission
+from core.logic import generate_test_variants, evaluate_randomness_of_variants, select_best_variants, correct_tests
 
 def test_generate_test_variants_deterministic():
     rng1 = random.Random(42)
@@ -23,8 +24,84 @@ def test_generate_test_variants_deterministic():
         assert [q.question_text for q in v1.questions] == [q.question_text for q in v2.questions]
         for q1, q2 in zip(v1.questions, v2.questions):
             assert [a.text for a in q1.answers] == [a.text for a in q2.answers]
+            assert q1.answers[q1.correct_index].is_correct
 
     # Verify original list is not mutated
     assert questions[0].question_text == "Q1"
     assert questions[1].question_text == "Q2"
     assert questions[2].question_text == "Q3"
+    assert [[a.text for a in q.answers] for q in questions] == [["A", "B"], ["C", "D"], ["E", "F"]]
+
+def test_correct_tests_scores_by_variant():
+    config = MagicMock(default_correct_score=4, default_wrong_score=0, default_no_answer_score=1)
+    q1 = Question("Q1", "S1", [AnswerChoice("A", True), AnswerChoice("B", False)])
+    q2 = Question("Q2", "S2", [AnswerChoice("C", True), AnswerChoice("D", False)], punteggio_corretta=2.5, punteggio_errata=-0.5)
+    variants = [Variant("1", [q1, q2]), Variant("2", [q2, q1])]
+    answer_keys = {"1": {"1": "A", "2": "B"}, "2": {"1": "A", "2": "A"}}
+    question_mappings = {"1": {"1": "S1", "2": "S2"}, "2": {"1": "S2", "2": "S1"}}
+    submissions = [
+        StudentSubmission("S003", "2", {"1": "a", "2": ""}),
+        StudentSubmission("S001", "1", {"1": "A", "2": "C"}),
+        StudentSubmission("S004", "9", {"1": "A", "2": "A"}),
+        StudentSubmission("S002", "1", {"1": "nan", "2": "b"}),
+    ]
+
+    results, stats = correct_tests(submissions, variants, answer_keys, question_mappings, config)
+
+    assert list(results) == ["S003", "S001", "S002"]
+    assert results["S001"]["correct_count"] == 1
+    assert results["S001"]["wrong_count"] == 1
+    assert results["S001"]["total_score"] == 3.5
+    assert results["S001"]["max_possible_score"] == 6.5
+    assert results["S002"]["answers"]["1"] == {"sheet": "S1", "response": "blank", "correct": "A", "points": 1}
+    assert results["S002"]["total_score"] == 3.5
+    assert results["S003"]["correct_score"] == 2.5
+    assert results["S003"]["blank_score"] == 1
+    assert results["S003"]["percentage"] == round(3.5 / 6.5 * 100, 2)
+    assert stats == {"S1": {"correct": 1, "wrong": 0, "blank": 2}, "S2": {"correct": 2, "wrong": 1, "blank": 0}}
+
+def test_correct_tests_keeps_integer_scores_next_to_float_custom_scores():
+    config = MagicMock(default_correct_score=4, default_wrong_score=0, default_no_answer_score=1)
+    q1 = Question("Q1", "S1", [AnswerChoice("A", True), AnswerChoice("B", False)])
+    q2 = Question("Q2", "S2", [AnswerChoice("C", True), AnswerChoice("D", False)], punteggio_errata=-1.0)
+    variants = [Variant("1", [q1, q2])]
+    answer_keys = {"1": {"1": "A", "2": "A"}}
+    question_mappings = {"1": {"1": "S1", "2": "S2"}}
+    submissions = [
+        StudentSubmission("S001", "1", {"1": "B", "2": "A"}),
+        StudentSubmission("S002", "1", {"1": "A", "2": "B"}),
+    ]
+
+    results, stats = correct_tests(submissions, variants, answer_keys, question_mappings, config)
+
+    assert repr(results["S001"]["answers"]["1"]["points"]) == "0"
+    assert repr(results["S001"]["total_score"]) == "4"
+    assert repr(results["S001"]["max_possible_score"]) == "8"
+    assert repr(results["S002"]["answers"]["2"]["points"]) == "-1.0"
+    assert repr(results["S002"]["total_score"]) == "3.0"
+
+def test_evaluate_randomness_of_variants_partial():
+    def q(text, correct_idx):
+        return Question(text, text, [AnswerChoice(f"{text}{i}", i == correct_idx) for i in range(2)])
+
+    variants = [
+        Variant("1", [q("Q1", 0), q("Q2", 0)]),
+        Variant("2", [q("Q2", 0), q("Q1", 1)])
+    ]
+
+    metrics = evaluate_randomness_of_variants(variants, ["Q1", "Q2"])
+
+    assert metrics == {"question_order_randomness": 0.5, "answer_order_randomness": 0.25, "combined_randomness": 0.38}
+    assert evaluate_randomness_of_variants([], ["Q1"])["combined_randomness"] == 0
+
+def test_select_best_variants_ranks_by_order_and_answers():
+    def q(text, correct_idx):
+        return Question(text, text, [AnswerChoice(f"{text}{i}", i == correct_idx) for i in range(2)])
+
+    unchanged = Variant("1", [q("Q1", 0), q("Q2", 0)])
+    swapped = Variant("2", [q("Q2", 0), q("Q1", 0)])
+    unknown = Variant("3", [q("Q1", 1), q("QX", 1)])
+
+    best = select_best_variants([unchanged, swapped, unknown], ["Q1", "Q2"], 2)
+
+    assert [v.variant_id for v in best] == ["3", "2"]
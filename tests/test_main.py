@@ -0,0 +1,43 @@
+import json
+import pytest
+import main
+from main import check_files
+
+def test_check_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "config.json").write_text("{}")
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "questions.xlsx").write_text("")
+
+    check_files(["config.json", "data/questions.xlsx"])
+
+    with pytest.raises(FileNotFoundError, match="File richiesto non trovato: student_answers.xlsx"):
+        check_files(["config.json", "student_answers.xlsx", "missing/question_mappings.json"])
+    with pytest.raises(FileNotFoundError, match="missing/question_mappings.json"):
+        check_files(["missing/question_mappings.json"])
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_load_question_mappings(tmp_path, monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(main, "orjson", None)
+    elif main.orjson is None:
+        pytest.skip("orjson non installato")
+    mappings = {"variant_answer_keys": {"1": {"1": "A"}}, "variant_question_mappings": {"1": {"1": "Ottica è"}}}
+    filename = tmp_path / "question_mappings.json"
+    filename.write_text(json.dumps(mappings, indent=4), encoding="utf-8")
+
+    assert main.load_question_mappings(str(filename)) == mappings
+
+def test_main_reports_missing_input_before_running_phase(tmp_path, monkeypatch, caplog):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "question_mappings.json").write_text("{}")
+    monkeypatch.setattr("sys.argv", ["main.py", "--phase", "2"])
+    monkeypatch.setattr(main, "phase2", lambda: pytest.fail("phase2 non deve partire"))
+
+    main.main()
+    assert "Errore in fase 2: File richiesto non trovato: config.json" in caplog.text
+
+    (tmp_path / "config.json").write_text("{}")
+    main.main()
+    assert "Errore in fase 2: File richiesto non trovato: student_answers.xlsx" in caplog.text
+    assert not (tmp_path / "report_questions").exists()
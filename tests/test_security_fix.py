@@ -1,12 +1,12 @@
 import subprocess
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 from io_handlers.latex_emitter import compile_latex_to_pdf
 
-def test_security_fix_no_shell_escape():
+def test_security_fix_no_shell_escape(tmp_path, monkeypatch):
     """Verify that pdflatex is called with -no-shell-escape."""
+    monkeypatch.chdir(tmp_path)
     with patch("subprocess.run") as mock_run:
-        mock_latex_obj = MagicMock()
-        compile_latex_to_pdf(mock_latex_obj, "test_output")
+        compile_latex_to_pdf("", "test_output")
 
         # Check all calls to subprocess.run
         pdflatex_calls = [call for call in mock_run.call_args_list if "pdflatex" in call.args[0]]
@@ -14,3 +14,23 @@ def test_security_fix_no_shell_escape():
         for call in pdflatex_calls:
             args = call.args[0]
             assert "-no-shell-escape" in args, f"pdflatex called without -no-shell-escape: {args}"
+
+def test_security_fix_no_shell_escape_with_latexmk(tmp_path, monkeypatch):
+    """Verify that latexmk is used when available and still disables shell escape."""
+    monkeypatch.chdir(tmp_path)
+    with patch("io_handlers.latex_emitter.shutil.which", return_value="/usr/bin/latexmk"), \
+         patch("subprocess.run") as mock_run:
+        compile_latex_to_pdf("", "test_output")
+
+    assert mock_run.call_count == 1
+    args = mock_run.call_args.args[0]
+    assert args[:2] == ["latexmk", "-pdf"]
+    assert "-no-shell-escape" in args
+
+def test_pdflatex_fallback_runs_two_passes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with patch("io_handlers.latex_emitter.shutil.which", return_value=None), \
+         patch("subprocess.run") as mock_run:
+        compile_latex_to_pdf("", "test_output")
+
+    assert [call.args[0][0] for call in mock_run.call_args_list] == ["pdflatex", "pdflatex"]
@@ -0,0 +1,33 @@
+from io_handlers.text_reporter import generate_question_report, generate_student_reports
+
+def test_generate_question_report_writes_one_chart_per_question(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats = {"correct": 2, "wrong": 1, "blank": 1, "correct_pct": 50.0, "wrong_pct": 25.0, "blank_pct": 25.0,
+             "difficulty": 0.5, "discrimination": 0.3}
+    question_analytics = {"Somma": dict(stats), "Ottica/1": dict(stats)}
+
+    generate_question_report(question_analytics, {"num_students": 4, "average_score": 2.5}, max_workers=2)
+
+    report_dir = tmp_path / "report_questions"
+    assert sorted(p.name for p in report_dir.iterdir()) == [
+        "all_questions_stacked.png", "question_Ottica1.png", "question_Somma.png", "report_quest.txt"
+    ]
+    assert "== Domanda: Ottica/1 ==" in (report_dir / "report_quest.txt").read_text(encoding="utf-8")
+
+def test_generate_student_reports_orders_students_by_score(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    def result(total, answers):
+        return {"variant_id": "1", "total_score": total, "max_possible_score": 2, "percentage": total * 50,
+                "correct_score": total, "wrong_score": 0, "blank_score": 0,
+                "correct_count": total, "wrong_count": 0, "blank_count": 2 - total, "answers": answers}
+
+    generate_student_reports({
+        "S1": result(0, {"1": {"sheet": "A", "response": "blank", "correct": "B", "points": 0}}),
+        "S2": result(1, {"1": {"sheet": "A", "response": "b", "correct": "B", "points": 1}}),
+    })
+
+    text = (tmp_path / "report_students_detailed.txt").read_text(encoding="utf-8")
+    assert text.startswith("=== Report Dettagliato degli Studenti ===\n\n\n---- Studente: S2 ----\n")
+    assert text.index("Studente: S2") < text.index("Studente: S1")
+    assert "Domanda 1 (A): Risposta: b - CORRETTA (punti: 1)" in text
+    assert text.endswith("Domanda 1 (A): Risposta: blank - NON DATA (punti: 0)")
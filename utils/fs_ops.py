@@ -4,13 +4,20 @@ def ensure_dir(path: str):
     """Creates a directory if it does not exist."""
     os.makedirs(path, exist_ok=True)
 
+_LATEX_TEMP_EXTENSIONS = frozenset({'.aux', '.log', '.out', '.toc', '.fls', '.fdb_latexmk'})
+
 def cleanup_latex_files(base_filename: str):
-    """Elimina i file temporanei generati da LaTeX."""
-    extensions = ['.aux', '.log', '.out', '.toc', '.fls', '.fdb_latexmk']
-    for ext in extensions:
-        temp_file = f"{base_filename}{ext}"
-        if os.path.exists(temp_file):
-            try:
-                os.remove(temp_file)
-            except OSError:
-                pass
+    """Elimina i file temporanei generati da LaTeX (una sola lettura della cartella)."""
+    directory = os.path.dirname(base_filename) or "."
+    base = os.path.basename(base_filename)
+    try:
+        with os.scandir(directory) as entries:
+            temp_files = [entry.path for entry in entries
+                          if entry.name.startswith(base) and entry.name[len(base):] in _LATEX_TEMP_EXTENSIONS]
+    except OSError:
+        return
+    for temp_file in temp_files:
+        try:
+            os.remove(temp_file)
+        except OSError:
+            pass